@@ -0,0 +1,370 @@
+import os
+import time
+import argparse
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import pandas as pd
+import mysql.connector
+
+from pipeline import (
+    CSV_NA_VALUES,
+    QUARANTINE_FOLDER,
+    calculate_aggregates,
+    detect_compression,
+    get_db_connection,
+    log_quarantine_reason,
+    open_input_stream,
+    store_data,
+    validate_and_transform_data_strict,
+)
+from preprocessing_kaggle_dataset import prepare_kaggle_frame
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+logger = logging.getLogger("Backfill")
+
+DEFAULT_CHUNK_ROWS = 10000
+DEFAULT_WORKERS = 4
+# Server-wide named lock held for the whole run, so two backfills (or a backfill
+# and --rebuild-indexes) never drop and rebuild the same indexes concurrently.
+BACKFILL_LOCK_NAME = 'raw_sensor_data_backfill'
+
+# Secondary indexes on raw_sensor_data (see setup_database_in_mysql.py). They are
+# dropped for the duration of a backfill and rebuilt in a single pass afterwards;
+# any found missing at startup are rebuilt as well.
+RAW_SECONDARY_INDEXES = {
+    'idx_sensor_id': '(sensor_id)',
+    'idx_timestamp': '(timestamp)',
+    'idx_file_name': '(file_name)',
+}
+
+
+def iter_input_chunks(path, chunk_rows):
+    """Yields DataFrame chunks from a (optionally compressed) CSV or a Parquet file without loading it whole."""
+    if path.lower().endswith('.parquet'):
+        if pq is None:
+            raise ValueError("pyarrow package is not installed; cannot read Parquet input.")
+        for record_batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield record_batch.to_pandas()
+        return
+    with open_input_stream(path, detect_compression(path)) as stream:
+        for chunk in pd.read_csv(stream, na_values=CSV_NA_VALUES, keep_default_na=True, dtype=str, chunksize=chunk_rows):
+            yield chunk
+
+
+def present_secondary_indexes(conn):
+    """Returns the names from RAW_SECONDARY_INDEXES that currently exist on raw_sensor_data."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'raw_sensor_data'")
+        return [name for (name,) in cursor.fetchall() if name in RAW_SECONDARY_INDEXES]
+    finally:
+        cursor.close()
+
+
+def acquire_backfill_lock(conn):
+    """Takes BACKFILL_LOCK_NAME on conn without waiting. Returns True if it was acquired."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT GET_LOCK(%s, 0)", (BACKFILL_LOCK_NAME,))
+        row = cursor.fetchone()
+        return row is not None and row[0] == 1
+    finally:
+        cursor.close()
+
+
+def release_backfill_lock(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (BACKFILL_LOCK_NAME,))
+        cursor.fetchone()
+    finally:
+        cursor.close()
+
+
+def drop_secondary_indexes(conn, names):
+    if not names:
+        return
+    cursor = conn.cursor()
+    try:
+        cursor.execute("ALTER TABLE raw_sensor_data " + ", ".join(f"DROP INDEX {name}" for name in names))
+        logger.info(f"Dropped secondary indexes for backfill: {', '.join(names)}")
+    finally:
+        cursor.close()
+
+
+def rebuild_secondary_indexes(conn, names):
+    if not names:
+        return
+    cursor = conn.cursor()
+    try:
+        start = time.perf_counter()
+        cursor.execute("ALTER TABLE raw_sensor_data " + ", ".join(f"ADD INDEX {name} {RAW_SECONDARY_INDEXES[name]}" for name in names))
+        logger.info(f"Rebuilt secondary indexes {', '.join(names)} in {time.perf_counter() - start:.1f}s.")
+    finally:
+        cursor.close()
+
+
+def rebuild_missing_secondary_indexes(conn):
+    """Re-reads the indexes present on raw_sensor_data and adds only the missing ones."""
+    present = present_secondary_indexes(conn)
+    missing = [name for name in RAW_SECONDARY_INDEXES if name not in present]
+    if missing:
+        rebuild_secondary_indexes(conn, missing)
+    else:
+        logger.info("All secondary indexes on raw_sensor_data are present.")
+
+
+def repair_secondary_indexes():
+    """Rebuilds any RAW_SECONDARY_INDEXES missing from raw_sensor_data. Returns True on success."""
+    conn = get_db_connection()
+    if conn is None:
+        logger.error("Could not connect to database. Index repair aborted.")
+        return False
+    try:
+        if not acquire_backfill_lock(conn):
+            logger.error(f"Lock '{BACKFILL_LOCK_NAME}' is held by a running backfill. Index repair aborted.")
+            return False
+        try:
+            rebuild_missing_secondary_indexes(conn)
+            return True
+        finally:
+            release_backfill_lock(conn)
+    except mysql.connector.Error as e:
+        logger.error(f"Index repair failed: {e}")
+        return False
+    finally:
+        if conn.is_connected():
+            conn.close()
+
+
+class ChunkWriter:
+    """Stores validated chunks from a pool of worker threads, each holding its own DB connection."""
+
+    def __init__(self, file_name, workers):
+        self.file_name = file_name
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="backfill")
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def _connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or not conn.is_connected():
+            conn = get_db_connection()
+            if conn is None:
+                raise mysql.connector.Error(msg="Could not connect to database.")
+            self.local.conn = conn
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+
+    def _store(self, batch, agg_df):
+        """Returns (stored, errors) for one chunk."""
+        errors = []
+        stored = store_data(self._connection(), batch, agg_df, self.file_name, batch_size=len(batch), errors=errors)
+        return stored, errors
+
+    def submit(self, batch, agg_df):
+        return self.executor.submit(self._store, batch, agg_df)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        for conn in self.connections:
+            if conn.is_connected():
+                conn.close()
+
+
+def batch_to_frame(batch):
+    """Converts a compact batch back to the pipeline's CSV input schema, e.g. for quarantining it."""
+    return pd.DataFrame({
+        'timestamp': pd.to_datetime(batch['timestamp'], unit='s').dt.strftime('%Y-%m-%d %H:%M:%S'),
+        'sensor_id': batch['sensor_id'].astype(str),
+        'temperature': batch['temperature'],
+        'humidity': batch['humidity'],
+        'pressure': batch['pressure'],
+    })
+
+
+def quarantine_chunk(chunk, file_name, chunk_no, reason):
+    chunk_name = f"{os.path.splitext(file_name)[0]}_backfill_chunk{chunk_no}.csv"
+    chunk.to_csv(os.path.join(QUARANTINE_FOLDER, chunk_name), index=False)
+    log_quarantine_reason(chunk_name, reason)
+
+
+def backfill(path, chunk_rows=DEFAULT_CHUNK_ROWS, workers=DEFAULT_WORKERS, kaggle=False, keep_indexes=False, start_chunk=1):
+    """
+    Streams a large historical file through the strict validator and aggregation
+    used by process_file, writing chunks to the database in parallel bulk batches.
+    Chunks before `start_chunk` are read but skipped, to resume a run that stopped
+    on unreadable input (use the same chunk_rows). Returns True if every chunk
+    was read, validated and stored.
+    """
+    file_name = os.path.basename(path)
+    logger.info(f"Starting backfill of '{path}' (chunk size {chunk_rows}, {workers} writers, from chunk {start_chunk}).")
+
+    # Held until the end of the run: it owns BACKFILL_LOCK_NAME
+    lock_conn = get_db_connection()
+    if lock_conn is None:
+        logger.error("Could not connect to database. Backfill aborted.")
+        return False
+    try:
+        if not acquire_backfill_lock(lock_conn):
+            logger.error(f"Lock '{BACKFILL_LOCK_NAME}' is held by another backfill. Backfill of '{file_name}' not started.")
+            lock_conn.close()
+            return False
+        present = present_secondary_indexes(lock_conn)
+        # With the lock held no other backfill is running, so missing indexes were left dropped by an interrupted one
+        missing = [name for name in RAW_SECONDARY_INDEXES if name not in present]
+        if missing:
+            logger.warning(f"raw_sensor_data is missing secondary indexes {', '.join(missing)}, left dropped by an interrupted backfill.")
+        if keep_indexes:
+            rebuild_secondary_indexes(lock_conn, missing)
+        else:
+            drop_secondary_indexes(lock_conn, present)
+    except mysql.connector.Error as e:
+        logger.error(f"Backfill setup failed: {e}")
+        if lock_conn.is_connected():
+            lock_conn.close() # Also releases the lock
+        return False
+
+    writer = ChunkWriter(file_name, workers)
+    pending = {}
+    failed_chunks = 0
+    chunks_read = 0
+    rows_read = rows_stored = row_offset = 0
+    read_error = None
+    indexes_ok = True
+    lock_lost = False
+    start = time.perf_counter()
+
+    def collect(done):
+        nonlocal failed_chunks, rows_stored, lock_lost
+        for future in done:
+            chunk_no, batch = pending.pop(future)
+            try:
+                stored, errors = future.result()
+            except Exception as e:
+                stored, errors = False, [str(e)]
+            if stored:
+                rows_stored += len(batch)
+            else:
+                failed_chunks += 1
+                reason = "; ".join(errors) or "Database store failed."
+                logger.error(f"Backfill chunk {chunk_no} of '{file_name}' failed to store: {reason}")
+                quarantine_chunk(batch_to_frame(batch), file_name, chunk_no, f"Backfill store failed: {reason}")
+        # Keep the lock connection from idling out (which would silently release the lock) during a long load
+        if not lock_lost:
+            try:
+                lock_conn.ping()
+            except mysql.connector.Error as e:
+                lock_lost = True
+                logger.error(f"Lost the connection holding lock '{BACKFILL_LOCK_NAME}': {e}. Overlapping backfills are no longer prevented.")
+        elapsed = time.perf_counter() - start
+        logger.info(f"Backfill progress: {rows_stored}/{rows_read} rows stored, {rows_stored / elapsed:,.0f} rows/sec.")
+
+    try:
+        try:
+            for chunk_no, chunk in enumerate(iter_input_chunks(path, chunk_rows), start=1):
+                raw_rows = len(chunk)
+                if chunk_no < start_chunk:
+                    row_offset += raw_rows
+                    chunks_read = chunk_no
+                    continue
+                if kaggle:
+                    chunk = prepare_kaggle_frame(chunk, row_offset)
+                row_offset += raw_rows
+                rows_read += len(chunk)
+
+                batch, errors = validate_and_transform_data_strict(chunk, f"{file_name} (chunk {chunk_no})")
+                if batch is None or batch.empty:
+                    quarantine_chunk(chunk, file_name, chunk_no, "; ".join(errors) or "Validation failed and no data remained (strict).")
+                    failed_chunks += 1
+                    chunks_read = chunk_no
+                    continue
+                del chunk
+                # Chunk-qualified name so chunks sharing a per-sensor start time don't overwrite each other's aggregates
+                agg_df = calculate_aggregates(batch, f"{file_name}#chunk{chunk_no}")
+
+                # Bound the number of in-flight chunks so memory stays flat on large inputs
+                while len(pending) >= workers * 2:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                pending[writer.submit(batch, agg_df)] = (chunk_no, batch)
+                chunks_read = chunk_no
+        except Exception as e:
+            # Malformed line, truncated archive, unmappable Kaggle rows, ...: finish what was already handed off
+            read_error = e
+            logger.error(f"Backfill of '{file_name}' stopped at chunk {chunks_read + 1} (input rows from {row_offset}): {e}")
+
+        if pending:
+            done, _ = wait(pending)
+            collect(done)
+        if read_error is not None:
+            resume_chunk = max(chunks_read + 1, start_chunk)
+            logger.error(f"All chunks of '{file_name}' before chunk {resume_chunk} were stored or quarantined. Fix the input and resume with "
+                         f"'python backfill.py {path} --chunk-rows {chunk_rows} --start-chunk {resume_chunk}'.")
+    finally:
+        writer.close()
+        if not keep_indexes:
+            # Fresh connection: the lock connection has been idle on the server side apart from pings
+            rebuild_conn = get_db_connection()
+            if rebuild_conn is None:
+                indexes_ok = False
+                logger.critical("Could not connect to rebuild secondary indexes on raw_sensor_data. "
+                                "Run 'python backfill.py --rebuild-indexes' to restore them.")
+            else:
+                try:
+                    rebuild_missing_secondary_indexes(rebuild_conn)
+                except mysql.connector.Error as e:
+                    indexes_ok = False
+                    logger.critical(f"Rebuilding secondary indexes on raw_sensor_data failed: {e}. "
+                                    f"Run 'python backfill.py --rebuild-indexes' to restore them.")
+                finally:
+                    if rebuild_conn.is_connected():
+                        rebuild_conn.close()
+        try:
+            if lock_conn.is_connected():
+                release_backfill_lock(lock_conn)
+        except mysql.connector.Error as e:
+            logger.warning(f"Could not release lock '{BACKFILL_LOCK_NAME}': {e}")
+        finally:
+            if lock_conn.is_connected():
+                lock_conn.close()
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"Backfill of '{file_name}' finished in {elapsed:.1f}s: {rows_stored}/{rows_read} rows stored "
+                f"({rows_stored / elapsed if elapsed else 0:,.0f} rows/sec), {failed_chunks} chunk(s) failed"
+                f"{', input not fully read' if read_error is not None else ''}.")
+    return failed_chunks == 0 and read_error is None and indexes_ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load a large historical CSV or Parquet file directly, bypassing the folder watcher.")
+    parser.add_argument('path', nargs='?', help="Input file (.csv, .csv.gz, .csv.bz2, .csv.zst or .parquet).")
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS, help="Rows per validation/insert batch.")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="Parallel database writers.")
+    parser.add_argument('--kaggle', action='store_true', help="Input is the raw Kaggle weatherHistory export; map it to the pipeline schema.")
+    parser.add_argument('--keep-indexes', action='store_true', help="Do not drop and rebuild secondary indexes on raw_sensor_data.")
+    parser.add_argument('--start-chunk', type=int, default=1, help="Skip chunks before this one, to resume a backfill that stopped on bad input (same --chunk-rows).")
+    parser.add_argument('--rebuild-indexes', action='store_true', help="Only rebuild secondary indexes missing from raw_sensor_data, then exit.")
+    args = parser.parse_args()
+
+    if args.rebuild_indexes:
+        exit(0 if repair_secondary_indexes() else 1)
+    if not args.path:
+        parser.error("path is required unless --rebuild-indexes is given.")
+
+    if not os.path.isfile(args.path):
+        logger.critical(f"Input file '{args.path}' not found.")
+        exit(1)
+    if args.start_chunk < 1:
+        parser.error("--start-chunk must be 1 or greater.")
+    ok = backfill(args.path, args.chunk_rows, args.workers, args.kaggle, args.keep_indexes, args.start_chunk)
+    exit(0 if ok else 1)
@@ -1,6 +1,15 @@
 import os
+import io
+import gzip
+import bz2
 import time
 import shutil
+import random
+import argparse
+import cProfile
+import pstats
+import tracemalloc
+import threading
 import pandas as pd
 import numpy as np 
 import mysql.connector
@@ -9,6 +18,12 @@ from watchdog.events import FileSystemEventHandler
 import logging
 import configparser
 from datetime import datetime
+from quantile_sketch import TDigest
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 config = configparser.ConfigParser()
 if not os.path.exists('config.ini'):
@@ -36,6 +51,11 @@ try:
     PRESSURE_MIN = config.getfloat('VALIDATION', 'PRESSURE_MIN', fallback=900.0)
     PRESSURE_MAX = config.getfloat('VALIDATION', 'PRESSURE_MAX', fallback=1100.0) 
 
+    PROFILE_ENABLED = config.getboolean('PROFILING', 'ENABLED', fallback=False)
+    PROFILE_SAMPLE_RATE = config.getfloat('PROFILING', 'SAMPLE_RATE', fallback=0.1)
+    PROFILE_TOP_N = config.getint('PROFILING', 'TOP_N', fallback=25)
+    PROFILE_FOLDER = config.get('PROFILING', 'OUTPUT_FOLDER', fallback=os.path.dirname(LOG_FILE))
+
 except (configparser.NoSectionError, configparser.NoOptionError, KeyError) as e:
     print(f"CRITICAL: Missing or invalid configuration in config.ini: {e}. Pipeline cannot start.")
     exit(1)
@@ -53,10 +73,45 @@ logging.basicConfig(
 logger = logging.getLogger("MainPipelineStrict")
 
 
+# cProfile and tracemalloc are process-global; only one file is profiled at a time.
+PROFILE_LOCK = threading.Lock()
+# Keep the profiler's own bookkeeping out of the allocation report.
+TRACEMALLOC_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
 os.makedirs(DATA_FOLDER, exist_ok=True)
 os.makedirs(QUARANTINE_FOLDER, exist_ok=True)
 os.makedirs(PROCESSED_FOLDER, exist_ok=True)
 
+# Accepted input extensions and the codec used to stream-decompress them.
+INPUT_EXTENSIONS = {
+    '.csv': None,
+    '.csv.gz': 'gzip',
+    '.csv.bz2': 'bz2',
+    '.csv.zst': 'zstd',
+}
+MAGIC_BYTES = [
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\x28\xb5\x2f\xfd', 'zstd'),
+]
+
+# Compact batch format shared by validation, aggregation and storage:
+# sensor_id is categorical, timestamp is int64 epoch seconds and the
+# metrics are float32 (the precision of the FLOAT columns they land in).
+METRIC_COLUMNS = ['temperature', 'humidity', 'pressure']
+STORE_BATCH_SIZE = 5000
+
+# Percentiles materialized per sensor/metric alongside the serialized t-digest.
+PERCENTILES = {'p50_value': 0.50, 'p95_value': 0.95, 'p99_value': 0.99}
+TDIGEST_COMPRESSION = 200
+
+READ_CHUNK_ROWS = 10000
+CSV_NA_VALUES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NULL', 'NaN', 'n/a', 'nan', 'null']
+
 def get_db_connection(retry_count=3, delay=5):
     attempt = 0
     while attempt < retry_count:
@@ -82,20 +137,138 @@ def get_db_connection(retry_count=3, delay=5):
                 return None
     return None
 
+def detect_compression(filepath):
+    """
+    Detects the compression codec of an input file. Magic bytes take precedence,
+    the file extension is used as a fallback. Returns None for plain CSV.
+    """
+    with open(filepath, 'rb') as f:
+        head = f.read(4)
+    for magic, codec in MAGIC_BYTES:
+        if head.startswith(magic):
+            return codec
+    filename = os.path.basename(filepath).lower()
+    for ext, codec in INPUT_EXTENSIONS.items():
+        if codec and filename.endswith(ext):
+            return codec
+    return None
+
+def open_input_stream(filepath, codec=None):
+    """
+    Opens an input file as a text stream, decompressing on the fly so the
+    uncompressed contents are never written to disk.
+    """
+    if codec == 'gzip':
+        return gzip.open(filepath, 'rt', encoding='utf-8', newline='')
+    if codec == 'bz2':
+        return bz2.open(filepath, 'rt', encoding='utf-8', newline='')
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ValueError("zstandard package is not installed; cannot read .zst input.")
+        reader = zstandard.ZstdDecompressor().stream_reader(open(filepath, 'rb'), closefd=True)
+        return io.TextIOWrapper(reader, encoding='utf-8', newline='')
+    return open(filepath, 'r', encoding='utf-8', newline='')
+
+def narrow_columns_in_place(df):
+    """
+    Replaces the timestamp and metric string columns of a frame with their
+    typed form (datetime64, float64) when the whole column parses, releasing
+    the per-row strings. A column with any unparsable value is left as strings
+    so the strict validator can report it.
+    """
+    if 'timestamp' in df.columns:
+        try:
+            timestamps = pd.to_datetime(df['timestamp'])
+            if timestamps.isna().sum() == df['timestamp'].isna().sum():
+                df['timestamp'] = timestamps
+            del timestamps
+        except (ValueError, TypeError, OverflowError):
+            pass
+    for col in METRIC_COLUMNS:
+        if col not in df.columns:
+            continue
+        values = pd.to_numeric(df[col], errors='coerce')
+        if values.isna().sum() == df[col].isna().sum():
+            df[col] = values
+        del values
+
+def read_input_frame(stream, chunk_rows=READ_CHUNK_ROWS):
+    """
+    Reads CSV text as strings in chunks, narrowing each chunk before the next
+    one is parsed so only one chunk's worth of per-row strings is alive at once.
+    """
+    chunks = []
+    for chunk in pd.read_csv(stream, na_values=CSV_NA_VALUES, keep_default_na=True, dtype=str, chunksize=chunk_rows):
+        narrow_columns_in_place(chunk)
+        chunks.append(chunk)
+    if not chunks:
+        return pd.DataFrame()
+    df = pd.concat(chunks)
+    del chunks
+    return df
+
+def to_compact_batch(df):
+    """
+    Converts a validated frame into the compact batch format. Each column is
+    popped from `df` as it is converted, so the source frame shrinks while the
+    batch grows instead of both being alive in full.
+    """
+    batch = pd.DataFrame(index=pd.RangeIndex(len(df)))
+    batch['sensor_id'] = df.pop('sensor_id').astype('category').values
+    timestamps = pd.to_datetime(df.pop('timestamp'))
+    if timestamps.dt.tz is not None:
+        # Keep the local wall-clock time, as mysql-connector does when given an aware datetime
+        timestamps = timestamps.dt.tz_localize(None)
+    # Round to whole seconds like MySQL DATETIME does, rather than truncating
+    timestamps = timestamps.dt.round('s')
+    batch['timestamp'] = ((timestamps - pd.Timestamp(0)) // pd.Timedelta(seconds=1)).astype('int64').to_numpy()
+    del timestamps
+    for col in METRIC_COLUMNS:
+        batch[col] = pd.to_numeric(df.pop(col)).astype('float32').to_numpy()
+    return batch
+
+def epoch_to_datetimes(epoch_seconds):
+    """Converts an array of int64 epoch seconds to naive datetime objects for the DB driver."""
+    return pd.to_datetime(epoch_seconds, unit='s').to_pydatetime().tolist()
+
+def rows_pass_fast_checks(df):
+    """
+    Vectorized pre-check for the strict validator. Returns True only when every
+    row is certain to pass, so the per-row loop (which produces the detailed
+    error messages) can be skipped. Any doubt falls back to the loop.
+    """
+    ranges = {
+        'temperature': (TEMP_MIN, TEMP_MAX),
+        'humidity': (HUMIDITY_MIN, HUMIDITY_MAX),
+        'pressure': (PRESSURE_MIN, PRESSURE_MAX),
+    }
+    try:
+        if df[['sensor_id', 'timestamp'] + METRIC_COLUMNS].isna().any().any():
+            return False
+        pd.to_datetime(df['timestamp'])
+        for col, (low, high) in ranges.items():
+            if not pd.to_numeric(df[col]).between(low, high).all():
+                return False
+    except (ValueError, TypeError, OverflowError):
+        return False
+    return True
+
 def validate_and_transform_data_strict(df_original, file_name):
     """
     STRICT VALIDATION: Validates data. If ANY row fails critical validation,
     the entire file is marked for quarantine.
-    Returns a tuple: (valid_df_if_all_ok_or_None, file_level_errors_list)
+    Returns a tuple: (compact_batch_if_all_ok_or_None, file_level_errors_list)
+    The input frame is narrowed in place rather than copied, and its columns
+    are moved into the compact batch on success.
     """
-    df = df_original.copy() # Work on a copy
+    df = df_original
     file_level_errors = []
     original_row_count = len(df)
     logger.info(f"File '{file_name}': Starting STRICT validation for {original_row_count} rows.")
 
    
     expected_columns = ['timestamp', 'sensor_id', 'temperature', 'humidity', 'pressure']
-    key_readings_cols = ['temperature', 'humidity', 'pressure'] 
+    key_readings_cols = METRIC_COLUMNS
 
     missing_cols = [col for col in expected_columns if col not in df.columns]
     if missing_cols:
@@ -109,68 +282,69 @@ def validate_and_transform_data_strict(df_original, file_name):
     df['timestamp'] = df['timestamp'].replace('', pd.NA)
     for col in key_readings_cols:
         df[col] = df[col].replace('', pd.NA) 
+    narrow_columns_in_place(df)
   
-    for index, row in df.iterrows():
-        row_errors = []
+    # Only walk the rows (to build the detailed error message) if the vectorized check finds a problem
+    if not rows_pass_fast_checks(df):
+        for index, row in df.iterrows():
+            row_errors = []
        
-        if pd.isnull(row['sensor_id']):
-            row_errors.append(f"Row {index+2}: 'sensor_id' is null.") 
+            if pd.isnull(row['sensor_id']):
+                row_errors.append(f"Row {index+2}: 'sensor_id' is null.") 
 
        
-        if pd.isnull(row['timestamp']):
-            row_errors.append(f"Row {index+2}: 'timestamp' string is null/empty.")
-        else:
-            try:
-                pd.to_datetime(row['timestamp'])
-            except (ValueError, TypeError, OverflowError):
-                row_errors.append(f"Row {index+2}: 'timestamp' ('{row['timestamp']}') is unparsable.")
+            if pd.isnull(row['timestamp']):
+                row_errors.append(f"Row {index+2}: 'timestamp' string is null/empty.")
+            else:
+                try:
+                    pd.to_datetime(row['timestamp'])
+                except (ValueError, TypeError, OverflowError):
+                    row_errors.append(f"Row {index+2}: 'timestamp' ('{row['timestamp']}') is unparsable.")
         
         
-        if pd.isnull(row['temperature']):
-            row_errors.append(f"Row {index+2}: 'temperature' is null.")
-        else:
-            try:
-                temp_val = float(row['temperature'])
-                if not (TEMP_MIN <= temp_val <= TEMP_MAX):
-                    row_errors.append(f"Row {index+2}: 'temperature' ({temp_val}) out of range [{TEMP_MIN}, {TEMP_MAX}].")
-            except (ValueError, TypeError):
-                row_errors.append(f"Row {index+2}: 'temperature' ('{row['temperature']}') is not a valid number.")
+            if pd.isnull(row['temperature']):
+                row_errors.append(f"Row {index+2}: 'temperature' is null.")
+            else:
+                try:
+                    temp_val = float(row['temperature'])
+                    if not (TEMP_MIN <= temp_val <= TEMP_MAX):
+                        row_errors.append(f"Row {index+2}: 'temperature' ({temp_val}) out of range [{TEMP_MIN}, {TEMP_MAX}].")
+                except (ValueError, TypeError):
+                    row_errors.append(f"Row {index+2}: 'temperature' ('{row['temperature']}') is not a valid number.")
 
         
-        if pd.isnull(row['humidity']):
-            row_errors.append(f"Row {index+2}: 'humidity' is null.")
-        else:
-            try:
-                hum_val = float(row['humidity'])
-                if not (HUMIDITY_MIN <= hum_val <= HUMIDITY_MAX):
-                     row_errors.append(f"Row {index+2}: 'humidity' ({hum_val}) out of range [{HUMIDITY_MIN}, {HUMIDITY_MAX}].")
-            except (ValueError, TypeError):
-                row_errors.append(f"Row {index+2}: 'humidity' ('{row['humidity']}') is not a valid number.")
+            if pd.isnull(row['humidity']):
+                row_errors.append(f"Row {index+2}: 'humidity' is null.")
+            else:
+                try:
+                    hum_val = float(row['humidity'])
+                    if not (HUMIDITY_MIN <= hum_val <= HUMIDITY_MAX):
+                         row_errors.append(f"Row {index+2}: 'humidity' ({hum_val}) out of range [{HUMIDITY_MIN}, {HUMIDITY_MAX}].")
+                except (ValueError, TypeError):
+                    row_errors.append(f"Row {index+2}: 'humidity' ('{row['humidity']}') is not a valid number.")
         
         
-        if pd.isnull(row['pressure']):
-            row_errors.append(f"Row {index+2}: 'pressure' is null.")
-        else:
-            try:
-                pres_val = float(row['pressure'])
-                if not (PRESSURE_MIN <= pres_val <= PRESSURE_MAX):
-                     row_errors.append(f"Row {index+2}: 'pressure' ({pres_val}) out of range [{PRESSURE_MIN}, {PRESSURE_MAX}].")
-            except (ValueError, TypeError):
-                row_errors.append(f"Row {index+2}: 'pressure' ('{row['pressure']}') is not a valid number.")
-
-        if row_errors:
-            full_error_msg = f"File '{file_name}': Row {index+2} (original index {index}) failed validation. Errors: {'; '.join(row_errors)}. Data: {row.to_dict()}. Quarantining file."
-            logger.error(full_error_msg)
-            file_level_errors.append(f"Validation failed at row {index+2}: {'; '.join(row_errors)}")
-            return None, file_level_errors 
+            if pd.isnull(row['pressure']):
+                row_errors.append(f"Row {index+2}: 'pressure' is null.")
+            else:
+                try:
+                    pres_val = float(row['pressure'])
+                    if not (PRESSURE_MIN <= pres_val <= PRESSURE_MAX):
+                         row_errors.append(f"Row {index+2}: 'pressure' ({pres_val}) out of range [{PRESSURE_MIN}, {PRESSURE_MAX}].")
+                except (ValueError, TypeError):
+                    row_errors.append(f"Row {index+2}: 'pressure' ('{row['pressure']}') is not a valid number.")
+
+            if row_errors:
+                full_error_msg = f"File '{file_name}': Row {index+2} (original index {index}) failed validation. Errors: {'; '.join(row_errors)}. Data: {row.to_dict()}. Quarantining file."
+                logger.error(full_error_msg)
+                file_level_errors.append(f"Validation failed at row {index+2}: {'; '.join(row_errors)}")
+                return None, file_level_errors 
 
     
     logger.info(f"File '{file_name}': All {original_row_count} rows passed strict validation.")
 
     try:
-        df['timestamp'] = pd.to_datetime(df['timestamp']) 
-        for col in key_readings_cols:
-            df[col] = pd.to_numeric(df[col]) 
+        batch = to_compact_batch(df)
     except Exception as e:
         
         msg = f"File '{file_name}': Error during bulk transformation after strict validation: {e}. Quarantining."
@@ -179,21 +353,21 @@ def validate_and_transform_data_strict(df_original, file_name):
         return None, file_level_errors
 
     
-    logger.info(f"File '{file_name}': Strict validation and transformation complete. All {len(df)} rows are valid.")
-    return df, file_level_errors 
+    logger.info(f"File '{file_name}': Strict validation and transformation complete. All {len(batch)} rows are valid.")
+    return batch, file_level_errors 
 
 
 def calculate_aggregates(df, file_name_original):
     if df.empty:
         return pd.DataFrame()
     aggregations = []
-    df['timestamp'] = pd.to_datetime(df['timestamp']) 
-    for sensor_id, group in df.groupby('sensor_id'):
-        agg_time = group['timestamp'].min() 
-        for metric_col in ['temperature', 'humidity', 'pressure']:
+    for sensor_id, group in df.groupby('sensor_id', observed=True):
+        agg_time = pd.to_datetime(group['timestamp'].min(), unit='s')
+        for metric_col in METRIC_COLUMNS:
             if metric_col in group.columns:
-                series = group[metric_col].dropna() 
+                series = group[metric_col].dropna().astype('float64') # Accumulate in double precision
                 if not series.empty:
+                    digest = TDigest.from_values(series.to_numpy(), TDIGEST_COMPRESSION)
                     aggregations.append({
                         'sensor_id': sensor_id,
                         'file_name': file_name_original, 
@@ -203,26 +377,40 @@ def calculate_aggregates(df, file_name_original):
                         'max_value': series.max(),
                         'avg_value': series.mean(),
                         'std_dev_value': series.std() if len(series) > 1 else 0.0,
-                        'record_count': len(series)
+                        'record_count': len(series),
+                        **{col: digest.quantile(q) for col, q in PERCENTILES.items()},
+                        'quantile_sketch': digest.to_bytes()
                     })
     return pd.DataFrame(aggregations)
 
 
-def store_data(conn, raw_df, agg_df, file_name_original):
+def store_data(conn, raw_df, agg_df, file_name_original, batch_size=STORE_BATCH_SIZE, errors=None):
+    """
+    Inserts the raw batch and its aggregates in one transaction. Returns True on
+    success; on failure rolls back, returns False and, if `errors` is a list,
+    appends the error message to it.
+    """
     cursor = None
     try:
         cursor = conn.cursor()
         if not raw_df.empty:
-            raw_data_to_insert = []
-            for _, row in raw_df.iterrows():
-                ts = row['timestamp'].to_pydatetime() if isinstance(row['timestamp'], pd.Timestamp) else row['timestamp']
-                raw_data_to_insert.append((
-                    row['sensor_id'], ts, row.get('temperature'), 
-                    row.get('humidity'), row.get('pressure'), file_name_original ))
-            if raw_data_to_insert:
-                sql_raw = "INSERT INTO raw_sensor_data (sensor_id, timestamp, temperature, humidity, pressure, file_name) VALUES (%s, %s, %s, %s, %s, %s)"
+            sql_raw = "INSERT INTO raw_sensor_data (sensor_id, timestamp, temperature, humidity, pressure, file_name) VALUES (%s, %s, %s, %s, %s, %s)"
+            categories = raw_df['sensor_id'].cat.categories.tolist()
+            codes = raw_df['sensor_id'].cat.codes.to_numpy()
+            timestamps = raw_df['timestamp'].to_numpy()
+            metrics = [raw_df[col].to_numpy() for col in METRIC_COLUMNS]
+            inserted = 0
+            # Materialise DB tuples one slice at a time instead of for the whole file
+            for start in range(0, len(raw_df), batch_size):
+                end = start + batch_size
+                raw_data_to_insert = list(zip(
+                    [categories[c] for c in codes[start:end]],
+                    epoch_to_datetimes(timestamps[start:end]),
+                    *[m[start:end].tolist() for m in metrics],
+                    [file_name_original] * len(codes[start:end])))
                 cursor.executemany(sql_raw, raw_data_to_insert)
-                logger.info(f"File '{file_name_original}': Inserted {cursor.rowcount} rows into 'raw_sensor_data'.")
+                inserted += cursor.rowcount
+            logger.info(f"File '{file_name_original}': Inserted {inserted} rows into 'raw_sensor_data'.")
 
         if not agg_df.empty:
             agg_data_to_insert = []
@@ -231,28 +419,35 @@ def store_data(conn, raw_df, agg_df, file_name_original):
                 agg_data_to_insert.append((
                     row['sensor_id'], row['file_name'], agg_ts, row['metric_name'],
                     row.get('min_value'), row.get('max_value'), row.get('avg_value'),
-                    row.get('std_dev_value'), row.get('record_count')))
+                    row.get('std_dev_value'), row.get('record_count'),
+                    row.get('p50_value'), row.get('p95_value'), row.get('p99_value'),
+                    row.get('quantile_sketch')))
             if agg_data_to_insert:
                 sql_agg = """
                 INSERT INTO aggregated_sensor_data
-                (sensor_id, file_name, aggregation_time, metric_name, min_value, max_value, avg_value, std_dev_value, record_count)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                (sensor_id, file_name, aggregation_time, metric_name, min_value, max_value, avg_value, std_dev_value, record_count,
+                 p50_value, p95_value, p99_value, quantile_sketch)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
                 ON DUPLICATE KEY UPDATE 
                     min_value=VALUES(min_value), max_value=VALUES(max_value),
                     avg_value=VALUES(avg_value), std_dev_value=VALUES(std_dev_value),
-                    record_count=VALUES(record_count), processed_at=NOW()"""
+                    record_count=VALUES(record_count), p50_value=VALUES(p50_value),
+                    p95_value=VALUES(p95_value), p99_value=VALUES(p99_value),
+                    quantile_sketch=VALUES(quantile_sketch), processed_at=NOW()"""
                 cursor.executemany(sql_agg, agg_data_to_insert)
                 logger.info(f"File '{file_name_original}': Inserted/Updated {cursor.rowcount} rows in 'aggregated_sensor_data'.")
         conn.commit()
         return True
     except mysql.connector.Error as e:
         logger.error(f"Database error storing data for '{file_name_original}': {e}")
+        if errors is not None: errors.append(f"Database error: {e}")
         if conn and conn.is_connected():
             try: conn.rollback()
             except Exception as rb_err: logger.error(f"Error during rollback: {rb_err}")
         return False
     except Exception as e: 
         logger.error(f"Unexpected error storing data for '{file_name_original}': {e}", exc_info=True)
+        if errors is not None: errors.append(f"Unexpected error: {e}")
         if conn and conn.is_connected():
             try: conn.rollback()
             except Exception as rb_err: logger.error(f"Error during rollback: {rb_err}")
@@ -270,7 +465,25 @@ def log_quarantine_reason(file_name, reason):
         logger.error(f"Failed to write to quarantine log for {file_name}: {e}")
     logger.warning(f"File '{file_name}' moved to quarantine. Reason: {reason}")
 
-def process_file(filepath):
+def end_stage(stats, name, stage_start):
+    """
+    Records a stage duration in stats['stages'] and calls the optional
+    stats['on_stage_end'] hook, which the profiler uses to sample memory while
+    the stage's data is still alive.
+    """
+    stats.setdefault('stages', {})[name] = time.perf_counter() - stage_start
+    hook = stats.get('on_stage_end')
+    if hook:
+        hook(name)
+
+def process_file(filepath, stats=None):
+    """
+    Processes a single input file end to end. If a dict is passed as `stats`,
+    it is filled with the row count and per-stage durations in seconds
+    (read, validate, aggregate, connect, store).
+    """
+    if stats is None:
+        stats = {}
     file_name_original = os.path.basename(filepath)
     logger.info(f"Processing new file: {filepath}")
     if not os.path.exists(filepath):
@@ -278,12 +491,20 @@ def process_file(filepath):
         return
     temp_filepath = None
     try:
+        codec = detect_compression(filepath)
+        if codec == 'zstd' and zstandard is None:
+            logger.error(f"File '{file_name_original}' is zstd-compressed but the zstandard package is not installed. File remains in data folder.")
+            return
         temp_filename = f"processing_{file_name_original}_{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
         temp_filepath = os.path.join(os.path.dirname(filepath), temp_filename)
         shutil.copy2(filepath, temp_filepath)
-        logger.info(f"Copied '{file_name_original}' to '{temp_filename}' for processing.")
+        logger.info(f"Copied '{file_name_original}' to '{temp_filename}' for processing (compression: {codec or 'none'}).")
         try:
-            df = pd.read_csv(temp_filepath, na_values=['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NULL', 'NaN', 'n/a', 'nan', 'null'], keep_default_na=True, dtype=str) # Read all as string initially for precise row-by-row validation
+            stage_start = time.perf_counter()
+            with open_input_stream(temp_filepath, codec) as stream:
+                df = read_input_frame(stream) # Read as strings for precise row-by-row validation, narrowed chunk by chunk
+            stats['rows'] = len(df)
+            end_stage(stats, 'read', stage_start)
             if df.empty:
                 logger.warning(f"File '{file_name_original}' (from {temp_filename}) is empty. Quarantining original.")
                 shutil.move(filepath, os.path.join(QUARANTINE_FOLDER, file_name_original))
@@ -305,7 +526,10 @@ def process_file(filepath):
                 logger.info(f"Removed temporary processing file: {temp_filepath}")
 
        
+        stage_start = time.perf_counter()
         valid_df, file_level_errors = validate_and_transform_data_strict(df, file_name_original)
+        end_stage(stats, 'validate', stage_start)
+        del df # Release the string frame; only the compact batch is kept in flight
 
         if valid_df is None or valid_df.empty: 
             error_summary = "; ".join(file_level_errors) if file_level_errors else "Validation failed and no data remained (strict)."
@@ -314,12 +538,19 @@ def process_file(filepath):
             log_quarantine_reason(file_name_original, error_summary)
             return
         
+        stage_start = time.perf_counter()
         agg_df = calculate_aggregates(valid_df, file_name_original)
+        end_stage(stats, 'aggregate', stage_start)
         db_conn = None
         try:
+            stage_start = time.perf_counter()
             db_conn = get_db_connection()
+            end_stage(stats, 'connect', stage_start) # Kept apart from 'store' so connection retries don't look like slow inserts
             if db_conn:
-                if store_data(db_conn, valid_df, agg_df, file_name_original):
+                stage_start = time.perf_counter()
+                stored = store_data(db_conn, valid_df, agg_df, file_name_original)
+                end_stage(stats, 'store', stage_start)
+                if stored:
                     logger.info(f"Successfully stored data from '{file_name_original}'. Moving to processed.")
                     shutil.move(filepath, os.path.join(PROCESSED_FOLDER, file_name_original))
                 else:
@@ -356,14 +587,115 @@ def process_file(filepath):
             except OSError as e: logger.error(f"Error removing temp file {temp_filepath} in finally block: {e}")
 
 
+def write_profile_report(file_name_original, profiler, stage_memory, peak_mem, stats, total):
+    """Writes the profile dump and the per-stage allocation report for one file to PROFILE_FOLDER."""
+    os.makedirs(PROFILE_FOLDER, exist_ok=True)
+    base = os.path.join(PROFILE_FOLDER, f"profile_{file_name_original}_{datetime.now().strftime('%Y%m%d%H%M%S%f')}")
+    profiler.dump_stats(f"{base}.prof")
+    stages = stats.get('stages', {})
+    stage_summary = ", ".join(f"{name}={secs:.3f}s" for name, secs in stages.items()) or "n/a"
+    with open(f"{base}_alloc.txt", "w") as f:
+        f.write(f"File: {file_name_original}\n")
+        f.write(f"Rows: {stats.get('rows', 'n/a')}\n")
+        f.write(f"Total: {total:.3f}s\n")
+        f.write(f"Stages: {stage_summary}\n")
+        f.write(f"Traced memory peak: {peak_mem / 1024:.1f} KiB\n")
+        for name, (stage_peak, top_stats) in stage_memory.items():
+            f.write(f"\nStage '{name}': {stages.get(name, 0):.3f}s, traced peak during stage {stage_peak / 1024:.1f} KiB\n")
+            f.write(f"Top {PROFILE_TOP_N} allocation sites live at end of stage:\n")
+            for stat in top_stats:
+                f.write(f"  {stat}\n")
+        f.write(f"\nTop {PROFILE_TOP_N} functions by cumulative time:\n")
+        pstats.Stats(profiler, stream=f).sort_stats('cumulative').print_stats(PROFILE_TOP_N)
+    logger.info(f"Profile for '{file_name_original}' written to '{base}.prof' and '{base}_alloc.txt' (rows: {stats.get('rows', 'n/a')}, {stage_summary}).")
+
+def profile_process_file(filepath):
+    """
+    Runs process_file under cProfile and tracemalloc and writes the profile dump
+    plus a per-stage allocation report (peak during each stage and the top-N
+    allocation sites live at its end), tagged with row count and stage
+    durations, to PROFILE_FOLDER. Both profilers are process-global, so callers
+    must hold PROFILE_LOCK. Profiling problems are logged and never stop the
+    file from being processed.
+    """
+    file_name_original = os.path.basename(filepath)
+    stage_memory = {}
+    profiler = cProfile.Profile()
+
+    def on_stage_end(name):
+        # Sample while the stage's frames are still referenced; keep the sampling itself out of the CPU profile
+        profiler.disable()
+        try:
+            stage_peak = tracemalloc.get_traced_memory()[1]
+            snapshot = tracemalloc.take_snapshot().filter_traces(TRACEMALLOC_FILTERS)
+            stage_memory[name] = (stage_peak, snapshot.statistics('lineno')[:PROFILE_TOP_N])
+            tracemalloc.reset_peak()
+        except RuntimeError as e:
+            logger.error(f"Failed to capture allocation snapshot for '{file_name_original}' at stage '{name}': {e}")
+        finally:
+            profiler.enable()
+
+    stats = {'on_stage_end': on_stage_end}
+    try:
+        tracemalloc.start()
+        profiler.enable()
+    except (RuntimeError, ValueError) as e:
+        logger.warning(f"Could not start profiler for '{file_name_original}': {e}. Processing without profiling.")
+        tracemalloc.stop()
+        process_file(filepath)
+        return
+
+    start = time.perf_counter()
+    final_peak = 0
+    try:
+        process_file(filepath, stats)
+    finally:
+        total = time.perf_counter() - start
+        profiler.disable()
+        try:
+            final_peak = tracemalloc.get_traced_memory()[1]
+        except RuntimeError as e:
+            logger.error(f"Failed to read traced memory for '{file_name_original}': {e}")
+        finally:
+            tracemalloc.stop()
+
+    if not stage_memory:
+        return
+    peak_mem = max([final_peak] + [stage_peak for stage_peak, _ in stage_memory.values()])
+    try:
+        write_profile_report(file_name_original, profiler, stage_memory, peak_mem, stats, total)
+    except Exception as e:
+        logger.error(f"Failed to write profile for '{file_name_original}': {e}")
+
+def run_file(filepath):
+    """
+    Dispatches a file to process_file, profiling a sampled fraction of files when
+    profiling is enabled. Only one file is profiled at a time; a sampled file that
+    arrives while another is being profiled is processed normally.
+    """
+    if PROFILE_ENABLED and random.random() < PROFILE_SAMPLE_RATE and PROFILE_LOCK.acquire(blocking=False):
+        try:
+            profile_process_file(filepath)
+        finally:
+            PROFILE_LOCK.release()
+    else:
+        process_file(filepath)
+
+
 
 class CSVFileHandler(FileSystemEventHandler):
     def __init__(self):
         self.recently_processed = set() 
         self.processing_lock_timeout = 30 
+        self.warned_missing_zstandard = False
     def _should_process(self, filepath):
         filename = os.path.basename(filepath)
-        if not filename.endswith('.csv'): return False
+        if not filename.lower().endswith(tuple(INPUT_EXTENSIONS)): return False
+        if zstandard is None and filename.lower().endswith('.csv.zst'):
+            if not self.warned_missing_zstandard:
+                logger.warning("zstandard package is not installed; .csv.zst files are left in the data folder until it is.")
+                self.warned_missing_zstandard = True
+            return False
         if filename.startswith('processing_'): return False
         if filepath in self.recently_processed:
             logger.debug(f"File '{filepath}' is in recently_processed set. Skipping event.")
@@ -377,7 +709,7 @@ class CSVFileHandler(FileSystemEventHandler):
                 logger.info(f"Watchdog: File created: {filepath}")
                 self._add_to_processed(filepath)
                 time.sleep(1) 
-                if os.path.exists(filepath): process_file(filepath)
+                if os.path.exists(filepath): run_file(filepath)
                 else:
                     logger.warning(f"Watchdog: File {filepath} disappeared before processing on create.")
                     if filepath in self.recently_processed: self.recently_processed.remove(filepath)
@@ -389,15 +721,26 @@ class CSVFileHandler(FileSystemEventHandler):
                     logger.info(f"Watchdog: File moved into monitored folder: {filepath}")
                     self._add_to_processed(filepath)
                     time.sleep(1) 
-                    if os.path.exists(filepath): process_file(filepath)
+                    if os.path.exists(filepath): run_file(filepath)
                     else:
                         logger.warning(f"Watchdog: File {filepath} disappeared before processing on move.")
                         if filepath in self.recently_processed: self.recently_processed.remove(filepath)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Real-time weather sensor data pipeline.")
+    parser.add_argument('--profile', action='store_true', help="Profile a sampled fraction of files with cProfile and tracemalloc.")
+    parser.add_argument('--profile-sample-rate', type=float, default=None, help="Fraction of files to profile (overrides [PROFILING] SAMPLE_RATE).")
+    args = parser.parse_args()
+    if args.profile:
+        PROFILE_ENABLED = True
+    if args.profile_sample_rate is not None:
+        PROFILE_SAMPLE_RATE = args.profile_sample_rate
+
     logger.info("==================================================")
     logger.info("Starting Real-Time Data Pipeline (STRICT VALIDATION)...") 
     logger.info(f"Monitoring folder: {os.path.abspath(DATA_FOLDER)}")
+    if PROFILE_ENABLED:
+        logger.info(f"Profiling enabled: sampling {PROFILE_SAMPLE_RATE:.0%} of files, reports in {os.path.abspath(PROFILE_FOLDER)}")
     
     event_handler = CSVFileHandler()
     observer = Observer()
@@ -415,7 +758,7 @@ if __name__ == "__main__":
             if os.path.isfile(filepath) and event_handler._should_process(filepath):
                 logger.info(f"Initial scan: Found file {filepath}. Processing.")
                 event_handler._add_to_processed(filepath) 
-                process_file(filepath)
+                run_file(filepath)
         logger.info(f"Initial scan complete. Now monitoring...")
         while True:
             
@@ -424,7 +767,7 @@ if __name__ == "__main__":
                 if os.path.isfile(filepath) and event_handler._should_process(filepath):
                     logger.info(f"Periodic scan: Found unprocessed file {filepath}. Processing.")
                     event_handler._add_to_processed(filepath)
-                    process_file(filepath)
+                    run_file(filepath)
             if len(event_handler.recently_processed) > 100: 
                 logger.warning("Clearing recently_processed set (fallback).")
                 event_handler.recently_processed.clear()
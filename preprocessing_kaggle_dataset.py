@@ -7,33 +7,26 @@ KAGGLE_CSV_PATH = r"D:\jupiterProjectsAleena\real_time_pipeline\archive\weatherH
 OUTPUT_DATA_FOLDER = 'data' 
 ROWS_PER_CHUNK = 5000  
 SENSOR_IDS = ["Kaggle_Weather_01", "Kaggle_Weather_02", "Kaggle_Weather_03"] 
+OUTPUT_COLUMNS = ['timestamp', 'sensor_id', 'temperature', 'humidity', 'pressure']
 
-def preprocess_and_chunk_data():
-    if not os.path.exists(KAGGLE_CSV_PATH):
-        print(f"Error: no CSV file found at '{KAGGLE_CSV_PATH}'. Please update the path.")
-        return
-
-    print(f"Loading Kaggle data from: {KAGGLE_CSV_PATH}")
-    try:
-        df = pd.read_csv(KAGGLE_CSV_PATH)
-    except Exception as e:
-        print(f"Error loading CSV: {e}")
-        return
-
-    print("Preprocessing data...")
-    
-    df.rename(columns={
+def prepare_kaggle_frame(df, row_offset=0):
+    """
+    Maps raw Kaggle weatherHistory columns to the pipeline's input schema.
+    row_offset is the position of df's first row in the full dataset, so
+    sensor IDs are assigned consistently when the data is read in chunks.
+    """
+    df = df.rename(columns={
         'Formatted Date': 'timestamp',
         'Temperature (C)': 'temperature',
         'Humidity': 'humidity', 
         'Pressure (millibars)': 'pressure'
-    }, inplace=True)
+    })
     
     required_cols = ['timestamp', 'temperature', 'humidity', 'pressure']
     df = df[required_cols].copy() 
 
     
-    df['sensor_id'] = [SENSOR_IDS[i % len(SENSOR_IDS)] for i in range(len(df))]
+    df['sensor_id'] = [SENSOR_IDS[(row_offset + i) % len(SENSOR_IDS)] for i in range(len(df))]
     
     try:
         df['timestamp'] = pd.to_datetime(df['timestamp'], utc=True) 
@@ -44,6 +37,22 @@ def preprocess_and_chunk_data():
         df.dropna(subset=['timestamp'], inplace=True)
         
     df.dropna(subset=['temperature', 'humidity', 'pressure', 'sensor_id', 'timestamp'], how='any', inplace=True)
+    return df[OUTPUT_COLUMNS]
+
+def preprocess_and_chunk_data():
+    if not os.path.exists(KAGGLE_CSV_PATH):
+        print(f"Error: no CSV file found at '{KAGGLE_CSV_PATH}'. Please update the path.")
+        return
+
+    print(f"Loading Kaggle data from: {KAGGLE_CSV_PATH}")
+    try:
+        df = pd.read_csv(KAGGLE_CSV_PATH)
+    except Exception as e:
+        print(f"Error loading CSV: {e}")
+        return
+
+    print("Preprocessing data...")
+    df = prepare_kaggle_frame(df)
 
     if df.empty:
         print("No data left after preprocessing. Check column names and data integrity.")
@@ -68,10 +77,7 @@ def preprocess_and_chunk_data():
             chunk_filepath = os.path.join(OUTPUT_DATA_FOLDER, chunk_filename)
             
             
-            output_columns = ['timestamp', 'sensor_id', 'temperature', 'humidity', 'pressure']
-            chunk_df_final = chunk_df[output_columns]
-
-            chunk_df_final.to_csv(chunk_filepath, index=False)
+            chunk_df.to_csv(chunk_filepath, index=False)
             print(f"Saved chunk {i+1}: {chunk_filepath}")
         else:
             print(f"Skipping empty chunk {i+1}")
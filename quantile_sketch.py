@@ -0,0 +1,98 @@
+import struct
+import numpy as np
+
+# Header: compression, centroid count, min value, max value.
+_HEADER = struct.Struct('<HIdd')
+
+
+class TDigest:
+    """
+    Mergeable t-digest quantile sketch. Centroids are kept as (mean, weight)
+    arrays; building, merging and compressing are done with numpy in one pass,
+    so a digest can be computed alongside the other aggregates for a file and
+    later merged with digests from other files or time windows.
+    """
+
+    def __init__(self, means=None, weights=None, min_value=np.nan, max_value=np.nan, compression=100):
+        self.compression = int(compression)
+        self.means = np.asarray(means if means is not None else [], dtype=np.float64)
+        self.weights = np.asarray(weights if weights is not None else [], dtype=np.float64)
+        self.min_value = float(min_value)
+        self.max_value = float(max_value)
+
+    @classmethod
+    def from_values(cls, values, compression=100):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return cls(compression=compression)
+        digest = cls(values, np.ones(values.size), values.min(), values.max(), compression)
+        digest._compress()
+        return digest
+
+    @property
+    def count(self):
+        return float(self.weights.sum())
+
+    def _compress(self):
+        """Groups sorted centroids so each group spans at most one unit of the k1 scale function."""
+        if self.means.size == 0:
+            return
+        order = np.argsort(self.means, kind='mergesort')
+        means, weights = self.means[order], self.weights[order]
+        total = weights.sum()
+        q_centre = (np.cumsum(weights) - weights / 2.0) / total
+        k = self.compression / (2.0 * np.pi) * np.arcsin(2.0 * q_centre - 1.0)
+        groups = np.floor(k - k[0]).astype(np.int64)
+        _, groups = np.unique(groups, return_inverse=True)
+        new_weights = np.bincount(groups, weights=weights)
+        self.means = np.bincount(groups, weights=means * weights) / new_weights
+        self.weights = new_weights
+
+    def merge(self, other):
+        """Returns a new digest covering the values of both digests."""
+        compression = max(self.compression, other.compression)
+        if other.means.size == 0:
+            return TDigest(self.means, self.weights, self.min_value, self.max_value, compression)
+        if self.means.size == 0:
+            return TDigest(other.means, other.weights, other.min_value, other.max_value, compression)
+        merged = TDigest(
+            np.concatenate([self.means, other.means]),
+            np.concatenate([self.weights, other.weights]),
+            min(self.min_value, other.min_value),
+            max(self.max_value, other.max_value),
+            compression)
+        merged._compress()
+        return merged
+
+    def quantile(self, q):
+        """Approximate value at quantile q (0..1), interpolating between centroid centres."""
+        if self.means.size == 0:
+            return None
+        cumulative = np.cumsum(self.weights)
+        centres = cumulative - self.weights / 2.0
+        x = np.concatenate([[0.0], centres, [cumulative[-1]]])
+        y = np.concatenate([[self.min_value], self.means, [self.max_value]])
+        return float(np.interp(q * cumulative[-1], x, y))
+
+    def to_bytes(self):
+        """Serializes to a compact blob: header, float32 means, float64 weights."""
+        header = _HEADER.pack(self.compression, self.means.size, self.min_value, self.max_value)
+        return header + self.means.astype('<f4').tobytes() + self.weights.astype('<f8').tobytes()
+
+    @classmethod
+    def from_bytes(cls, blob):
+        compression, size, min_value, max_value = _HEADER.unpack_from(blob, 0)
+        offset = _HEADER.size
+        means = np.frombuffer(blob, dtype='<f4', count=size, offset=offset)
+        weights = np.frombuffer(blob, dtype='<f8', count=size, offset=offset + 4 * size)
+        return cls(means, weights, min_value, max_value, compression)
+
+
+def merge_sketches(blobs):
+    """Merges serialized digests (e.g. across files or time windows) into a single digest."""
+    merged = None
+    for blob in blobs:
+        digest = TDigest.from_bytes(blob)
+        merged = digest if merged is None else merged.merge(digest)
+    return merged if merged is not None else TDigest()
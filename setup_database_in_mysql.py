@@ -90,6 +90,10 @@ def main():
         avg_value FLOAT,
         std_dev_value FLOAT,
         record_count INT,                     -- Number of records used for this aggregation
+        p50_value FLOAT,                      -- Percentiles materialized from quantile_sketch
+        p95_value FLOAT,
+        p99_value FLOAT,
+        quantile_sketch BLOB,                 -- Serialized t-digest, mergeable across files/time windows
         processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         UNIQUE KEY uk_sensor_file_metric_time (sensor_id, file_name, metric_name, aggregation_time),
         INDEX idx_agg_sensor_file (sensor_id, file_name),
@@ -102,6 +106,21 @@ def main():
     except mysql.connector.Error as err:
         print(f"Failed creating 'aggregated_sensor_data' table: {err}")
 
+    # Bring tables created before the percentile columns existed up to date.
+    percentile_columns = [
+        ("p50_value", "FLOAT"),
+        ("p95_value", "FLOAT"),
+        ("p99_value", "FLOAT"),
+        ("quantile_sketch", "BLOB"),
+    ]
+    for column_name, column_type in percentile_columns:
+        try:
+            cursor.execute(f"ALTER TABLE aggregated_sensor_data ADD COLUMN {column_name} {column_type}")
+            print(f"Column '{column_name}' added to 'aggregated_sensor_data'.")
+        except mysql.connector.Error as err:
+            if err.errno != errorcode.ER_DUP_FIELDNAME:
+                print(f"Failed adding column '{column_name}' to 'aggregated_sensor_data': {err}")
+
 
     
 